@@ -1,20 +1,38 @@
 import os
+import csv
+import copy
+import atexit
+import bisect
 import json
+import re
+import shelve
+import shutil
 import bcrypt
+import queue
 import smtplib
-import random
+import sqlite3
+import secrets
+import threading
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import streamlit as st
-import google.generativeai as genai
 from dotenv import load_dotenv
 from email.mime.text import MIMEText
-from streamlit_extras.colored_header import colored_header
-from streamlit_extras.stylable_container import stylable_container
 from datetime import datetime
+from types import MappingProxyType
+from collections import OrderedDict
+from urllib.parse import quote
+from typing_extensions import TypedDict # pydantic rejects typing.TypedDict on Python < 3.12
 import time
 import logging
 import numpy as np
 
+try:
+    import orjson as json_fast # Faster parsing of AI responses; raises json.JSONDecodeError subclasses
+except ImportError:
+    import json as json_fast
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -32,6 +50,8 @@ def initialize_session_state():
         'show_otp_verification': False,
         'num_items': 5,
         'vegetarian': False,
+        'medical_conditions': [],
+        'user_profile': None,
         'daily_calories': 2000,
         'current_meal_plan': None,
         'activity_level': "moderate",
@@ -54,6 +74,7 @@ def load_environment():
             st.error("❌ Google API Key not found in environment variables. Please set it in a .env file.")
             return False
             
+        import google.generativeai as genai # Deferred: heavy import only needed once the app is configured
         genai.configure(api_key=api_key)
         
         # Check SMTP environment variables
@@ -69,12 +90,24 @@ def load_environment():
 # --- Constants ---
 SMTP_EMAIL = os.getenv("SMTP_EMAIL")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_TIMEOUT = 20 # seconds; a hung server must not block every sender waiting on the pool lock
 DEFAULT_PASSWORD = "Test@1234" # Consider making this more secure or randomly generated for production
-USER_DB_FILE = "users.csv"
-USER_PROFILE_FILE = "user_profiles.csv"
-NUTRITION_DB_FILE = "nutrition_data.csv"
-MEAL_HISTORY_FILE = "meal_history.csv"
-FOOD_DB_FILE = "food_database.csv"
+USER_DB_FILE = "users.db"
+LEGACY_USER_DB_FILE = "users.csv" # Imported into USER_DB_FILE on first run
+PASSWORD_SPECIAL_CHARS = frozenset("!@#$%^&*()-_+=")
+_SPLIT_COMMA = re.compile(r'\s*,\s*')
+USER_PROFILE_DIR = "user_profiles" # Parquet, one partition per user: user_id=<escaped id>/profile.parquet
+LEGACY_USER_PROFILE_FILE = "user_profiles.csv"
+NUTRITION_DB_FILE = "nutrition_data.parquet"
+MEAL_HISTORY_DIR = "meal_history" # Parquet, one partition per user holding one fragment per feedback
+LEGACY_MEAL_HISTORY_FILE = "meal_history.csv"
+FOOD_DB_FILE = "food_database.parquet"
+# Share of the daily calorie target for each meal, in display order
+MEAL_RATIOS = MappingProxyType({"breakfast": 0.25, "lunch": 0.35, "dinner": 0.30, "snacks": 0.10})
+GEMINI_MODEL_NAME = "gemini-1.5-flash"
+MEAL_PLAN_CACHE_FILE = "meal_plan_cache" # shelve base name for cached AI meal plans
+MEAL_PLAN_CACHE_TTL = 7 * 24 * 60 * 60 # seconds
+MEAL_PLAN_CACHE_SIZE = 256 # in-memory entries
 
 # Enhanced Medical Conditions Database
 MEDICAL_CONDITIONS = {
@@ -130,24 +163,210 @@ MEDICAL_CONDITIONS = {
     }
 }
 
+# Profile form options, with option -> index maps for preselecting stored values
+MEDICAL_CONDITION_OPTIONS = tuple(MEDICAL_CONDITIONS)
+GENDER_OPTIONS = ("Male", "Female", "Other")
+GENDER_INDEX = {gender: i for i, gender in enumerate(GENDER_OPTIONS)}
+DIET_GOAL_OPTIONS = ("Maintain Weight", "Weight Loss", "Weight Gain", "Muscle Gain")
+DIET_GOAL_INDEX = {goal: i for i, goal in enumerate(DIET_GOAL_OPTIONS)}
+ACTIVITY_OPTIONS = ("Sedentary", "Light", "Moderate", "Active", "Very Active")
+ACTIVITY_INDEX = {level.lower(): i for i, level in enumerate(ACTIVITY_OPTIONS)} # Keyed lowercase; older profiles store e.g. "sedentary"
+
+# Activity multipliers (keys lowercase), read-only
+ACTIVITY_MULTIPLIERS = MappingProxyType({
+    "sedentary": 1.2, # little or no exercise
+    "light": 1.375, # light exercise/sports 1-3 days/week
+    "moderate": 1.55, # moderate exercise/sports 3-5 days/week
+    "active": 1.725, # hard exercise/sports 6-7 days a week
+    "very active": 1.9 # very hard exercise/physical job
+})
+
+# Daily calorie adjustment per diet goal (keys lowercase), read-only
+GOAL_ADJUSTMENTS = MappingProxyType({
+    "weight loss": -500,
+    "weight gain": 500,
+    "muscle gain": 300, # A slight caloric surplus for muscle gain
+    "maintain weight": 0
+})
+
+# BMI category boundaries; each label covers [previous cut, next cut)
+_BMI_CUTS = (18.5, 25.0, 30.0)
+_BMI_LABELS = ("Underweight", "Normal weight", "Overweight", "Obese")
+
+# Prompt text per condition, joined once at import (before freezing, to keep list order)
+_CONDITION_TEXT_CACHE = {
+    name: f"{name}: {info['description']}. Avoid: {', '.join(info['avoid'])}. Recommend: {', '.join(info['recommend'])}"
+    for name, info in MEDICAL_CONDITIONS.items()
+}
+_CONDITION_AVOID_CACHE = {
+    name: f"{name}: avoid {', '.join(info['avoid'])}"
+    for name, info in MEDICAL_CONDITIONS.items()
+}
+for _info in MEDICAL_CONDITIONS.values():
+    _info["avoid"] = frozenset(_info["avoid"])
+    _info["recommend"] = frozenset(_info["recommend"])
+
 # --- Database Setup Functions ---
+def get_user_db():
+    """Return the session's SQLite connection to the user database"""
+    if "user_db_conn" not in st.session_state:
+        st.session_state.user_db_conn = sqlite3.connect(USER_DB_FILE, check_same_thread=False)
+    return st.session_state.user_db_conn
+
+def _import_legacy_users(conn):
+    """Copy accounts from the old users.csv into an empty users table"""
+    if not os.path.exists(LEGACY_USER_DB_FILE):
+        return
+    if conn.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+        return
+
+    def as_flag(value):
+        return (value or "").strip().lower() in ("true", "1", "1.0")
+
+    # Stream rows as plain strings straight into SQLite; no pandas parse or dtype inference
+    with open(LEGACY_USER_DB_FILE, newline='') as f, conn:
+        imported = conn.executemany(
+            "INSERT OR IGNORE INTO users (user_id, password, otp, verified, needs_password_change) VALUES (?, ?, ?, ?, ?)",
+            (
+                (
+                    row["user_id"],
+                    row["password"],
+                    (row["otp"] or "").removesuffix(".0") or None,
+                    as_flag(row["verified"]),
+                    as_flag(row["needs_password_change"]),
+                )
+                for row in csv.DictReader(f)
+                if row["user_id"]
+            )
+        ).rowcount
+    logger.info(f"Imported {imported} users from {LEGACY_USER_DB_FILE} into {USER_DB_FILE}.")
+
+# Fixed column types for profile.parquet; user_id lives in the partition path
+PROFILE_SCHEMA = pa.schema([
+    pa.field("age", pa.int16()),
+    pa.field("height", pa.float64()), # Floats: int fields would silently truncate e.g. 70.5 kg
+    pa.field("weight", pa.float64()),
+    pa.field("gender", pa.string()),
+    pa.field("medical_conditions", pa.string()),
+    pa.field("diet_goal", pa.string()),
+    pa.field("vegetarian", pa.bool_()),
+    pa.field("bmi", pa.float64()),
+    pa.field("daily_calories", pa.int32()),
+    pa.field("activity_level", pa.string()),
+    pa.field("created_at", pa.string()),
+])
+
+# Fixed column types for meal history fragments; inference breaks on legacy rows with empty dates
+MEAL_HISTORY_SCHEMA = pa.schema([
+    pa.field("date", pa.string()),
+    pa.field("meal", pa.string()),
+    pa.field("rating", pa.int64()),
+    pa.field("feedback", pa.string()),
+])
+
+def _user_partition(root, user_id):
+    """Hive-style partition directory for a user, escaped the way pyarrow escapes partition values"""
+    return os.path.join(root, f"user_id={quote(str(user_id), safe='')}")
+
+def _profile_path(user_id, root=USER_PROFILE_DIR):
+    return os.path.join(_user_partition(root, user_id), "profile.parquet")
+
+def _write_profile(user_id, profile, root=USER_PROFILE_DIR):
+    """Replace a user's profile partition with a single-row Parquet file"""
+    path = _profile_path(user_id, root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = os.path.join(os.path.dirname(path), ".profile.parquet.tmp") # Dot-files are skipped by dataset readers
+    # A fixed schema skips type inference and keeps every user's file consistently typed
+    pq.write_table(pa.Table.from_pylist([profile], schema=PROFILE_SCHEMA), tmp_path)
+    os.replace(tmp_path, path)
+
+def _append_meal_history(user_id, records, root=MEAL_HISTORY_DIR):
+    """Add feedback records as a new Parquet fragment in the user's partition; nothing is rewritten"""
+    partition = _user_partition(root, user_id)
+    os.makedirs(partition, exist_ok=True)
+    fragment = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{secrets.token_hex(4)}.parquet"
+    pq.write_table(pa.Table.from_pylist(records, schema=MEAL_HISTORY_SCHEMA), os.path.join(partition, fragment))
+
+def _legacy_records(legacy_df, schema):
+    """Rows of a legacy CSV as dicts; blank or non-numeric cells in numeric schema columns become None (stored as null)"""
+    legacy_df = legacy_df.copy()
+    for field in schema:
+        if field.name in legacy_df and (pa.types.is_integer(field.type) or pa.types.is_floating(field.type)):
+            legacy_df[field.name] = pd.to_numeric(legacy_df[field.name], errors="coerce")
+    return legacy_df.astype(object).where(legacy_df.notna(), None).to_dict("records")
+
+def _import_legacy_profiles(root):
+    """Copy profiles from the old user_profiles.csv, keeping the latest row per user"""
+    if not os.path.exists(LEGACY_USER_PROFILE_FILE):
+        return
+    legacy_df = pd.read_csv(LEGACY_USER_PROFILE_FILE).fillna({"medical_conditions": "", "created_at": ""})
+    legacy_df = legacy_df.drop_duplicates("user_id", keep="last")
+    imported = 0
+    for record in _legacy_records(legacy_df, PROFILE_SCHEMA):
+        user_id = record.pop("user_id")
+        # Without these the dashboard can't render; the user is sent back to the profile form instead
+        if record.get("bmi") is None or record.get("daily_calories") is None:
+            logger.warning(f"Skipping legacy profile for {user_id}: missing bmi or daily_calories.")
+            continue
+        try:
+            _write_profile(user_id, record, root)
+        except (pa.ArrowException, OSError) as e:
+            logger.warning(f"Skipping legacy profile for {user_id}: {str(e)}")
+            continue
+        imported += 1
+    logger.info(f"Imported {imported} profiles from {LEGACY_USER_PROFILE_FILE} into {USER_PROFILE_DIR}.")
+
+def _import_legacy_meal_history(root):
+    """Copy feedback from the old meal_history.csv, one fragment per user"""
+    if not os.path.exists(LEGACY_MEAL_HISTORY_FILE):
+        return
+    legacy_df = pd.read_csv(LEGACY_MEAL_HISTORY_FILE).fillna({"date": "", "meal": "", "feedback": ""})
+    imported = 0
+    for user_id, user_df in legacy_df.groupby("user_id"):
+        records = []
+        for record in _legacy_records(user_df.drop(columns="user_id"), MEAL_HISTORY_SCHEMA):
+            try:
+                pa.Table.from_pylist([record], schema=MEAL_HISTORY_SCHEMA) # Validate the row on its own
+            except pa.ArrowException as e:
+                logger.warning(f"Skipping legacy feedback entry for {user_id}: {str(e)}")
+                continue
+            records.append(record)
+        if records:
+            _append_meal_history(user_id, records, root)
+            imported += len(records)
+    logger.info(f"Imported {imported} feedback entries from {LEGACY_MEAL_HISTORY_FILE} into {MEAL_HISTORY_DIR}.")
+
+def _create_partition_root(root, import_legacy):
+    """Create a partition root, staging the legacy import so the directory only appears once it succeeded"""
+    staging = f"{root}.importing"
+    shutil.rmtree(staging, ignore_errors=True) # Leftover from an interrupted import
+    os.makedirs(staging)
+    import_legacy(staging)
+    os.replace(staging, root)
+
 def ensure_user_db():
     """Create user database files if they don't exist"""
     try:
-        columns = ["user_id", "password", "otp", "verified", "needs_password_change"]
-        if not os.path.exists(USER_DB_FILE):
-            pd.DataFrame(columns=columns).to_csv(USER_DB_FILE, index=False)
-            logger.info(f"{USER_DB_FILE} created.")
+        conn = get_user_db()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS users ("
+                "user_id TEXT PRIMARY KEY, password TEXT, otp TEXT, "
+                "verified INTEGER DEFAULT 0, needs_password_change INTEGER DEFAULT 1, created_at TEXT)"
+            )
+            # Databases created before created_at existed
+            user_columns = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+            if "created_at" not in user_columns:
+                conn.execute("ALTER TABLE users ADD COLUMN created_at TEXT")
+        _import_legacy_users(conn)
         
-        profile_columns = ["user_id", "age", "height", "weight", "gender", "medical_conditions", 
-                             "diet_goal", "vegetarian", "bmi", "daily_calories", "activity_level", "created_at"]
-        if not os.path.exists(USER_PROFILE_FILE):
-            pd.DataFrame(columns=profile_columns).to_csv(USER_PROFILE_FILE, index=False)
-            logger.info(f"{USER_PROFILE_FILE} created.")
+        if not os.path.isdir(USER_PROFILE_DIR):
+            _create_partition_root(USER_PROFILE_DIR, _import_legacy_profiles)
+            logger.info(f"{USER_PROFILE_DIR} created.")
         
-        if not os.path.exists(MEAL_HISTORY_FILE):
-            pd.DataFrame(columns=["user_id", "date", "meal", "rating", "feedback"]).to_csv(MEAL_HISTORY_FILE, index=False)
-            logger.info(f"{MEAL_HISTORY_FILE} created.")
+        if not os.path.isdir(MEAL_HISTORY_DIR):
+            _create_partition_root(MEAL_HISTORY_DIR, _import_legacy_meal_history)
+            logger.info(f"{MEAL_HISTORY_DIR} created.")
         
         return True
     except Exception as e:
@@ -173,11 +392,12 @@ def ensure_nutrition_db():
                 "fiber": [0, 1.8, 2.6, 0, 0, 2.8, 2.2, 12, 3, 0, 1.7, 7, 2.4, 8, 0],
                 "vegetarian": [False, True, True, False, False, True, True, True, True, True, 
                                True, True, True, True, False],
-                "meal_type": ["lunch,dinner", "lunch,dinner", "lunch,dinner", "breakfast", "lunch,dinner",
-                               "breakfast,lunch", "lunch,dinner", "snacks", "lunch,dinner", "breakfast,snacks",
-                               "breakfast", "breakfast,lunch", "breakfast,snacks", "lunch,dinner", "lunch,dinner"]
+                # Meal bit flags: 1 breakfast, 2 lunch, 4 dinner, 8 snacks (6 = lunch+dinner, 9 = breakfast+snacks)
+                "meal_mask": pa.array([6, 6, 6, 1, 6,
+                                       3, 6, 8, 6, 9,
+                                       1, 3, 9, 6, 6], type=pa.uint8())
             }
-            pd.DataFrame(sample_data).to_csv(NUTRITION_DB_FILE, index=False)
+            pq.write_table(pa.Table.from_pydict(sample_data), NUTRITION_DB_FILE)
             logger.info(f"{NUTRITION_DB_FILE} created with sample data.")
         return True
     except Exception as e:
@@ -200,12 +420,12 @@ def ensure_food_db():
                 "fats": [3.6, 0.9, 0.6, 11, 13, 1.9, 0.4, 49, 0.1, 0.4],
                 "fiber": [0, 1.8, 2.6, 0, 0, 2.8, 2.2, 12, 3, 0],
                 "vegetarian": [False, True, True, False, False, True, True, True, True, True],
-                "meal_type": ["lunch,dinner", "lunch,dinner", "lunch,dinner", "breakfast", "lunch,dinner",
-                               "breakfast,lunch", "lunch,dinner", "snacks", "lunch,dinner", "breakfast,snacks"],
+                # Meal bit flags: 1 breakfast, 2 lunch, 4 dinner, 8 snacks (6 = lunch+dinner, 9 = breakfast+snacks)
+                "meal_mask": pa.array([6, 6, 6, 1, 6, 3, 6, 8, 6, 9], type=pa.uint8()),
                 "is_main": [True, True, False, True, True, True, False, False, True, False],
                 "ingredients": ["chicken", "rice", "broccoli", "eggs", "salmon", "quinoa", "spinach", "almonds", "sweet potato", "yogurt"]
             }
-            pd.DataFrame(sample_data).to_csv(FOOD_DB_FILE, index=False)
+            pq.write_table(pa.Table.from_pydict(sample_data), FOOD_DB_FILE)
             logger.info(f"{FOOD_DB_FILE} created with sample data.")
         return True
     except Exception as e:
@@ -213,46 +433,112 @@ def ensure_food_db():
         st.error(f"❌ Error setting up food database: {str(e)}")
         return False
 
-# --- Enhanced Google API Functions ---
-def generate_medical_condition_diet(medical_conditions, vegetarian=False, daily_calories=2000, diet_goal="Maintain Weight"):
-    """
-    Generate a comprehensive diet plan using Google's Gemini API
-    considering medical conditions, dietary preferences, and goals
-    """
+@st.cache_resource(show_spinner=False)
+def _bootstrap():
+    """Database setup and environment configuration, run once per server process"""
+    return ensure_user_db() and ensure_nutrition_db() and ensure_food_db() and load_environment()
+
+# --- Meal Plan Cache ---
+@st.cache_resource
+def _get_meal_plan_memory_cache():
+    """Process-wide LRU of cached plans (least recently used first); survives Streamlit reruns"""
+    return OrderedDict()
+
+@st.cache_resource
+def _get_meal_plan_cache_lock():
+    """Serializes cache access across sessions; the dbm.dumb fallback is not safe for concurrent writers"""
+    return threading.Lock()
+
+def _remember_meal_plan(memory_cache, key, entry):
+    """Insert or refresh an entry as most recently used, evicting down to MEAL_PLAN_CACHE_SIZE; caller holds the lock"""
+    memory_cache[key] = entry
+    memory_cache.move_to_end(key)
+    while len(memory_cache) > MEAL_PLAN_CACHE_SIZE:
+        memory_cache.popitem(last=False)
+
+def _meal_plan_cache_key(medical_conditions, vegetarian, daily_calories, diet_goal):
+    """Canonical key for a meal plan request; condition order does not matter"""
+    return json.dumps([sorted(medical_conditions), bool(vegetarian), int(daily_calories), diet_goal])
+
+def get_cached_meal_plan(key):
+    """Return a copy of a cached meal plan younger than MEAL_PLAN_CACHE_TTL, or None"""
+    memory_cache = _get_meal_plan_memory_cache()
     try:
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        
-        # Prepare medical condition information
-        condition_info = []
-        for condition in medical_conditions:
-            if condition in MEDICAL_CONDITIONS:
-                avoid_foods = ", ".join(MEDICAL_CONDITIONS[condition]["avoid"])
-                recommend_foods = ", ".join(MEDICAL_CONDITIONS[condition]["recommend"])
-                description = MEDICAL_CONDITIONS[condition]["description"]
-                condition_info.append(f"{condition}: {description}. Avoid: {avoid_foods}. Recommend: {recommend_foods}")
-        
-        condition_text = "\n".join(condition_info) if condition_info else "No specific medical conditions"
-        
-        # Adjust calorie distribution based on meal types and diet goal
-        breakfast_cal_percent = 0.25
-        lunch_cal_percent = 0.35
-        dinner_cal_percent = 0.30
-        snacks_cal_percent = 0.10
+        with _get_meal_plan_cache_lock():
+            entry = memory_cache.get(key)
+            if entry is None:
+                with shelve.open(MEAL_PLAN_CACHE_FILE) as cache:
+                    entry = cache.get(key)
+                    if entry is not None and time.time() - entry[0] > MEAL_PLAN_CACHE_TTL:
+                        del cache[key]
+            if entry is None:
+                return None
+
+            stored_at, meal_plan = entry
+            if time.time() - stored_at > MEAL_PLAN_CACHE_TTL:
+                memory_cache.pop(key, None)
+                return None
+
+            _remember_meal_plan(memory_cache, key, entry)
+    except Exception as e:
+        logger.warning(f"Could not read meal plan cache: {str(e)}")
+        return None
+    return copy.deepcopy(meal_plan)
 
-        prompt = f"""
+def cache_meal_plan(key, meal_plan):
+    """Store a validated meal plan in memory and on disk, pruning expired plans from the disk cache"""
+    now = time.time()
+    entry = (now, copy.deepcopy(meal_plan))
+    try:
+        with _get_meal_plan_cache_lock():
+            _remember_meal_plan(_get_meal_plan_memory_cache(), key, entry)
+            with shelve.open(MEAL_PLAN_CACHE_FILE) as cache:
+                cache[key] = entry
+                for stale_key in [k for k in cache if now - cache[k][0] > MEAL_PLAN_CACHE_TTL]:
+                    del cache[stale_key]
+    except Exception as e:
+        logger.warning(f"Could not write meal plan cache: {str(e)}")
+
+# --- AI Response Schemas ---
+# Passed to Gemini as response_schema so the model can only return well-formed JSON of this shape
+class FoodItemSchema(TypedDict):
+    food: str
+    quantity: str
+    calories: float
+    protein: float
+    carbs: float
+    fats: float
+    fiber: float
+    benefits: str
+
+class MealSchema(TypedDict):
+    items: list[FoodItemSchema]
+    total_calories: float
+    meal_benefits: str
+
+class DailySummarySchema(TypedDict):
+    total_calories: float
+    total_protein: float
+    total_carbs: float
+    total_fats: float
+    total_fiber: float
+    medical_compliance: str
+
+class MealPlanSchema(TypedDict):
+    breakfast: MealSchema
+    lunch: MealSchema
+    dinner: MealSchema
+    snacks: MealSchema
+    daily_summary: DailySummarySchema
+
+MEAL_PLAN_GENERATION_CONFIG = {"response_mime_type": "application/json", "response_schema": MealPlanSchema}
+ALTERNATIVES_GENERATION_CONFIG = {"response_mime_type": "application/json", "response_schema": list[str]}
+
+# Static parts of the meal plan prompt, built once at import; only the profile section is formatted per call
+_MEAL_PLAN_PROMPT_HEADER = """
         As a certified nutritionist, create a comprehensive daily meal plan for someone with the following profile:
-
-        Medical Conditions: {condition_text}
-        Dietary Preference: {'Vegetarian' if vegetarian else 'Non-Vegetarian'}
-        Daily Calorie Target: {daily_calories} calories
-        Diet Goal: {diet_goal}
-
-        Please provide a detailed meal plan with:
-        1. Breakfast ({breakfast_cal_percent*100}% of daily calories, target: {round(daily_calories * breakfast_cal_percent)} calories)
-        2. Lunch ({lunch_cal_percent*100}% of daily calories, target: {round(daily_calories * lunch_cal_percent)} calories)  
-        3. Dinner ({dinner_cal_percent*100}% of daily calories, target: {round(daily_calories * dinner_cal_percent)} calories)
-        4. Snacks ({snacks_cal_percent*100}% of daily calories, target: {round(daily_calories * snacks_cal_percent)} calories)
-
+"""
+_MEAL_PLAN_PROMPT_INSTRUCTIONS = """
         For each meal, include 2-3 specific food items with:
         - Exact food name
         - Portion size (in grams or common units like "1 cup", "2 slices", "1 medium apple")
@@ -267,10 +553,10 @@ def generate_medical_condition_diet(medical_conditions, vegetarian=False, daily_
         - **ALL FIELDS MUST BE POPULATED WITH REALISTIC VALUES. DO NOT LEAVE ANY FIELD AS N/A, 0, OR EMPTY.**
 
         Return ONLY a JSON object in this exact format:
-        {{
-            "breakfast": {{
+        {
+            "breakfast": {
                 "items": [
-                    {{
+                    {
                         "food": "Food Name",
                         "quantity": "100g",
                         "calories": 150.0,
@@ -279,8 +565,8 @@ def generate_medical_condition_diet(medical_conditions, vegetarian=False, daily_
                         "fats": 5.0,
                         "fiber": 3.0,
                         "benefits": "Why this food helps with the conditions"
-                    }},
-                    {{
+                    },
+                    {
                         "food": "Food Name 2",
                         "quantity": "50g",
                         "calories": 75.0,
@@ -289,14 +575,14 @@ def generate_medical_condition_diet(medical_conditions, vegetarian=False, daily_
                         "fats": 2.5,
                         "fiber": 1.5,
                         "benefits": "Why this food helps with the conditions"
-                    }}
+                    }
                 ],
                 "total_calories": 225.0,
                 "meal_benefits": "Overall benefits of this breakfast"
-            }},
-            "lunch": {{
+            },
+            "lunch": {
                 "items": [
-                    {{
+                    {
                         "food": "Food Name",
                         "quantity": "200g",
                         "calories": 300.0,
@@ -305,14 +591,14 @@ def generate_medical_condition_diet(medical_conditions, vegetarian=False, daily_
                         "fats": 10.0,
                         "fiber": 6.0,
                         "benefits": "Why this food helps with the conditions"
-                    }}
+                    }
                 ],
                 "total_calories": 300.0,
                 "meal_benefits": "Overall benefits of this lunch"
-            }},
-            "dinner": {{
+            },
+            "dinner": {
                 "items": [
-                    {{
+                    {
                         "food": "Food Name",
                         "quantity": "180g",
                         "calories": 250.0,
@@ -321,14 +607,14 @@ def generate_medical_condition_diet(medical_conditions, vegetarian=False, daily_
                         "fats": 8.0,
                         "fiber": 5.0,
                         "benefits": "Why this food helps with the conditions"
-                    }}
+                    }
                 ],
                 "total_calories": 250.0,
                 "meal_benefits": "Overall benefits of this dinner"
-            }},
-            "snacks": {{
+            },
+            "snacks": {
                 "items": [
-                    {{
+                    {
                         "food": "Food Name",
                         "quantity": "80g",
                         "calories": 100.0,
@@ -337,44 +623,86 @@ def generate_medical_condition_diet(medical_conditions, vegetarian=False, daily_
                         "fats": 3.0,
                         "fiber": 2.0,
                         "benefits": "Why this food helps with the conditions"
-                    }}
+                    }
                 ],
                 "total_calories": 100.0,
                 "meal_benefits": "Overall benefits of these snacks"
-            }},
-            "daily_summary": {{
+            },
+            "daily_summary": {
                 "total_calories": 875.0,
                 "total_protein": 53.0,
                 "total_carbs": 80.0,
                 "total_fats": 23.5,
                 "total_fiber": 17.5,
                 "medical_compliance": "How this plan addresses the medical conditions and adherence to dietary goals. For example, 'This plan is designed to help manage blood sugar levels for Diabetes by focusing on whole grains and lean proteins, and is gluten-free for Celiac Disease.'"
-            }}
-        }}
+            }
+        }
 
         **Ensure all nutritional numbers (calories, protein, carbs, fats, fiber) are realistic and the food items are appropriate for the specified medical conditions and dietary preferences.**
         **The `total_calories` for each meal and the `daily_summary` should accurately reflect the sum of the `items` within them.**
         **Provide a detailed `medical_compliance` explanation in the `daily_summary`.**
         """
+
+# --- Enhanced Google API Functions ---
+@st.cache_resource
+def get_gemini_model():
+    """Shared Gemini model instance, built once per process after genai.configure()"""
+    import google.generativeai as genai
+    return genai.GenerativeModel(GEMINI_MODEL_NAME)
+
+def generate_medical_condition_diet(medical_conditions, vegetarian=False, daily_calories=2000, diet_goal="Maintain Weight", force_refresh=False):
+    """
+    Generate a comprehensive diet plan using Google's Gemini API
+    considering medical conditions, dietary preferences, and goals.
+    force_refresh skips the cached plan (the new plan still replaces it).
+    """
+    cache_key = _meal_plan_cache_key(medical_conditions, vegetarian, daily_calories, diet_goal)
+    cached_plan = None if force_refresh else get_cached_meal_plan(cache_key)
+    if cached_plan is not None:
+        logger.info("Serving meal plan from cache.")
+        return cached_plan
+
+    try:
+        model = get_gemini_model()
         
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
+        # Prepare medical condition information
+        # One dict probe per condition; unknown conditions map to None and are dropped
+        condition_text = "\n".join(
+            filter(None, map(_CONDITION_TEXT_CACHE.get, medical_conditions))
+        ) or "No specific medical conditions"
+        
+        # Adjust calorie distribution based on meal types and diet goal
+        breakfast_cal_percent = MEAL_RATIOS["breakfast"]
+        lunch_cal_percent = MEAL_RATIOS["lunch"]
+        dinner_cal_percent = MEAL_RATIOS["dinner"]
+        snacks_cal_percent = MEAL_RATIOS["snacks"]
+
+        prompt = _MEAL_PLAN_PROMPT_HEADER + f"""
+        Medical Conditions: {condition_text}
+        Dietary Preference: {'Vegetarian' if vegetarian else 'Non-Vegetarian'}
+        Daily Calorie Target: {daily_calories} calories
+        Diet Goal: {diet_goal}
+
+        Please provide a detailed meal plan with:
+        1. Breakfast ({breakfast_cal_percent*100}% of daily calories, target: {round(daily_calories * breakfast_cal_percent)} calories)
+        2. Lunch ({lunch_cal_percent*100}% of daily calories, target: {round(daily_calories * lunch_cal_percent)} calories)  
+        3. Dinner ({dinner_cal_percent*100}% of daily calories, target: {round(daily_calories * dinner_cal_percent)} calories)
+        4. Snacks ({snacks_cal_percent*100}% of daily calories, target: {round(daily_calories * snacks_cal_percent)} calories)
+""" + _MEAL_PLAN_PROMPT_INSTRUCTIONS
         
-        # Clean up the response to ensure it's valid JSON
-        if response_text.startswith('```json'):
-            response_text = response_text[7:-3].strip()
-        elif response_text.startswith('```'):
-            response_text = response_text[3:-3].strip()
+        response = model.generate_content(prompt, generation_config=MEAL_PLAN_GENERATION_CONFIG)
+        response_text = response.text.strip()
         
         # --- CRITICAL DEBUGGING STEP ---
         logger.info(f"Raw AI Response for Meal Plan: \n{response_text}") 
         # --- END CRITICAL DEBUGGING STEP ---
         
         # Parse JSON response
-        meal_plan = json.loads(response_text)
+        meal_plan = json_fast.loads(response_text)
         
-        # Validate the structure and convert types
+        # Validate the structure and convert types; the SDK drops `required` from the schema, so fields can still be missing
         required_meals = ["breakfast", "lunch", "dinner", "snacks"]
+        nutrient_fields = ["calories", "protein", "carbs", "fats", "fiber"]
         if not all(meal in meal_plan for meal in required_meals):
             raise ValueError("Missing required meal types in AI response")
             
@@ -386,21 +714,23 @@ def generate_medical_condition_diet(medical_conditions, vegetarian=False, daily_
             # Ensure total_calories is a float
             meal["total_calories"] = float(meal["total_calories"])
             
-            for item in meal["items"]:
+            items = meal["items"]
+            for item in items:
                 required_fields = ["food", "quantity", "calories", "protein", "carbs", "fats", "fiber", "benefits"]
                 if not all(field in item for field in required_fields):
                     raise ValueError(f"Missing fields in food item: {item} within {meal_name}. Missing one of: {', '.join(required_fields)}")
                 
-                # Convert to proper types
-                item["calories"] = float(item["calories"])
-                item["protein"] = float(item["protein"])
-                item["carbs"] = float(item["carbs"])
-                item["fats"] = float(item["fats"])
-                item["fiber"] = float(item["fiber"])
                 # Ensure benefits is not empty
                 if not item["benefits"]:
                     item["benefits"] = "General nutritional benefits."
 
+            # Convert every item's nutrients to floats in one cast, then scatter back as Python floats
+            nutrients = np.asarray([[item[field] for field in nutrient_fields] for item in items], dtype=np.float64)
+            if not np.isfinite(nutrients).all(): # null in the JSON casts to NaN instead of raising
+                raise ValueError(f"Missing or non-numeric nutrient values in {meal_name} meal")
+            for values, item in zip(nutrients.tolist(), items):
+                item.update(zip(nutrient_fields, values))
+
             # Ensure meal_benefits is not empty
             if not meal["meal_benefits"]:
                 meal["meal_benefits"] = f"A balanced {meal_name} for your dietary needs."
@@ -414,16 +744,16 @@ def generate_medical_condition_diet(medical_conditions, vegetarian=False, daily_
         if not all(field in daily_summary for field in summary_fields):
             raise ValueError("Missing required fields in daily_summary")
 
-        daily_summary["total_calories"] = float(daily_summary["total_calories"])
-        daily_summary["total_protein"] = float(daily_summary["total_protein"])
-        daily_summary["total_carbs"] = float(daily_summary["total_carbs"])
-        daily_summary["total_fats"] = float(daily_summary["total_fats"])
-        daily_summary["total_fiber"] = float(daily_summary["total_fiber"])
+        total_fields = summary_fields[:5]
+        totals = np.asarray([daily_summary[field] for field in total_fields], dtype=np.float64)
+        if not np.isfinite(totals).all():
+            raise ValueError("Missing or non-numeric totals in daily_summary")
+        daily_summary.update(zip(total_fields, totals.tolist()))
         # Ensure medical_compliance is not empty
         if not daily_summary["medical_compliance"]:
             daily_summary["medical_compliance"] = "This plan aligns with your general dietary goals."
 
-
+        cache_meal_plan(cache_key, meal_plan)
         return meal_plan
         
     except json.JSONDecodeError as e:
@@ -443,15 +773,11 @@ def generate_medical_condition_diet(medical_conditions, vegetarian=False, daily_
 def get_food_alternatives(food_item, medical_conditions, vegetarian=False):
     """Get alternative foods using Google API"""
     try:
-        model = genai.GenerativeModel("gemini-1.5-flash")
+        model = get_gemini_model()
         
-        condition_restrictions = []
-        for condition in medical_conditions:
-            if condition in MEDICAL_CONDITIONS:
-                avoid_foods = ", ".join(MEDICAL_CONDITIONS[condition]["avoid"])
-                condition_restrictions.append(f"{condition}: avoid {avoid_foods}")
-        
-        restrictions = "\n".join(condition_restrictions) if condition_restrictions else "No specific restrictions"
+        restrictions = "\n".join(
+            filter(None, map(_CONDITION_AVOID_CACHE.get, medical_conditions))
+        ) or "No specific restrictions"
         
         prompt = f"""
         Suggest 3 healthy alternatives to "{food_item}" that are:
@@ -463,15 +789,10 @@ def get_food_alternatives(food_item, medical_conditions, vegetarian=False):
         ["Alternative 1", "Alternative 2", "Alternative 3"]
         """
         
-        response = model.generate_content(prompt)
+        response = model.generate_content(prompt, generation_config=ALTERNATIVES_GENERATION_CONFIG)
         response_text = response.text.strip()
         
-        if response_text.startswith('```json'):
-            response_text = response_text[7:-3].strip()
-        elif response_text.startswith('```'):
-            response_text = response_text[3:-3].strip()
-        
-        alternatives = json.loads(response_text)
+        alternatives = json_fast.loads(response_text)
         return alternatives if isinstance(alternatives, list) else []
         
     except json.JSONDecodeError as e:
@@ -484,6 +805,25 @@ def get_food_alternatives(food_item, medical_conditions, vegetarian=False):
         return []
 
 # --- Authentication Functions ---
+def meets_password_policy(password):
+    """At least 8 characters with a lowercase letter, an uppercase letter, a digit and one of !@#$%^&*()-_+="""
+    if len(password) < 8:
+        return False
+    # One pass over the characters; str methods rather than [a-z]/[A-Z] so non-ASCII letters count, as they always have
+    has_digit = has_upper = has_lower = has_special = False
+    for char in password:
+        if char.isdigit():
+            has_digit = True
+        elif char.isupper():
+            has_upper = True
+        elif char.islower():
+            has_lower = True
+        elif char in PASSWORD_SPECIAL_CHARS:
+            has_special = True
+        if has_digit and has_upper and has_lower and has_special:
+            return True
+    return False
+
 def hash_password(password):
     """Hash password using bcrypt"""
     try:
@@ -493,32 +833,121 @@ def hash_password(password):
         logger.error(f"Error hashing password: {str(e)}")
         return None
 
-def send_email(to_email, subject, body):
-    """Send email with error handling"""
-    if not SMTP_EMAIL or not SMTP_PASSWORD:
-        st.warning("⚠️ Email configuration not found (SMTP_EMAIL/SMTP_PASSWORD). Using mock email sending.")
-        logger.warning(f"Mock email sent to {to_email} with subject '{subject}'")
-        return True # Simulate success if email credentials are not set
-        
+class _SMTPPool:
+    """Keeps one authenticated SMTP connection open and reconnects when it goes stale"""
+
+    def __init__(self, host="smtp.gmail.com", port=465):
+        self.host = host
+        self.port = port
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        # Only pool the connection once it is authenticated; an unauthenticated one still passes noop()
+        conn = smtplib.SMTP_SSL(self.host, self.port, timeout=SMTP_TIMEOUT)
+        try:
+            conn.login(SMTP_EMAIL, SMTP_PASSWORD)
+        except BaseException:
+            conn.close()
+            raise
+        self.conn = conn
+        logger.info("SMTP connection established.")
+
+    def get(self):
+        """Return a live connection; callers must hold self.lock"""
+        if self.conn is not None:
+            try:
+                if self.conn.noop()[0] == 250:
+                    return self.conn
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.close()
+        self._connect()
+        return self.conn
+
+    def sendmail(self, from_addr, to_addr, message):
+        with self.lock:
+            try:
+                self.get().sendmail(from_addr, to_addr, message)
+            except smtplib.SMTPServerDisconnected:
+                # The server may drop us between the health check and the send
+                self.close()
+                self.get().sendmail(from_addr, to_addr, message)
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.conn = None
+
+@st.cache_resource
+def get_smtp_pool():
+    """Process-wide SMTP pool; Streamlit re-executes this module on every rerun"""
+    pool = _SMTPPool()
+    atexit.register(pool.close)
+    return pool
+
+def _deliver_email(pool, to_email, subject, body):
+    """Send one email through the pool; makes no Streamlit calls so it can run off the UI thread"""
     try:
         msg = MIMEText(body)
         msg["Subject"] = subject
         msg["From"] = SMTP_EMAIL
         msg["To"] = to_email
         
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-            server.login(SMTP_EMAIL, SMTP_PASSWORD)
-            server.sendmail(SMTP_EMAIL, to_email, msg.as_string())
+        pool.sendmail(SMTP_EMAIL, to_email, msg.as_string())
         logger.info(f"Email sent successfully to {to_email}")
         return True
     except Exception as e:
         logger.error(f"Email failed: {str(e)}", exc_info=True) # Log full traceback
-        st.error(f"❌ Failed to send email to {to_email}. Please check your SMTP settings or try again.")
         return False
 
+@st.cache_resource
+def get_email_queue():
+    """Start the background email sender once per process and return its queue"""
+    email_queue = queue.Queue()
+    pool = get_smtp_pool()
+
+    def worker():
+        while True:
+            to_email, subject, body = email_queue.get()
+            try:
+                _deliver_email(pool, to_email, subject, body)
+            finally:
+                email_queue.task_done()
+
+    threading.Thread(target=worker, name="email-sender", daemon=True).start()
+    return email_queue
+
+def _email_configured(to_email, subject):
+    """Warn and log a mock send when SMTP credentials are missing"""
+    if not SMTP_EMAIL or not SMTP_PASSWORD:
+        st.warning("⚠️ Email configuration not found (SMTP_EMAIL/SMTP_PASSWORD). Using mock email sending.")
+        logger.warning(f"Mock email sent to {to_email} with subject '{subject}'")
+        return False
+    return True
+
+def send_email(to_email, subject, body):
+    """Send email and wait for the result, for flows that must confirm delivery"""
+    if not _email_configured(to_email, subject):
+        return True # Simulate success if email credentials are not set
+        
+    if _deliver_email(get_smtp_pool(), to_email, subject, body):
+        return True
+    st.error(f"❌ Failed to send email to {to_email}. Please check your SMTP settings or try again.")
+    return False
+
+def queue_email(to_email, subject, body):
+    """Hand an email to the background sender and return immediately"""
+    if _email_configured(to_email, subject):
+        get_email_queue().put((to_email, subject, body))
+    return True
+
 def generate_otp():
-    """Generate 6-digit OTP"""
-    return str(random.randint(100000, 999999))
+    """Generate 6-digit OTP from the OS CSPRNG"""
+    return f"{secrets.randbelow(900_000) + 100_000:06d}"
 
 def register_user(user_id):
     """Register new user with enhanced error handling"""
@@ -528,8 +957,8 @@ def register_user(user_id):
                 st.error("❌ Failed to set up user database. Cannot register.")
                 return False
                 
-        df = pd.read_csv(USER_DB_FILE)
-        if user_id in df.user_id.values:
+        conn = get_user_db()
+        if conn.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone():
             st.warning("⚠️ This email is already registered. Please login or reset your password.")
             return False # Already exists
         
@@ -540,16 +969,14 @@ def register_user(user_id):
             st.error("❌ Failed to hash password during registration.")
             return False
             
-        new_user = pd.DataFrame([{
-            "user_id": user_id,
-            "password": hashed,
-            "otp": otp,
-            "verified": False,
-            "needs_password_change": True
-        }])
-        
-        df = pd.concat([df, new_user], ignore_index=True)
-        df.to_csv(USER_DB_FILE, index=False)
+        with conn:
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO users (user_id, password, otp, verified, needs_password_change, created_at) VALUES (?, ?, ?, 0, 1, ?)",
+                (user_id, hashed, otp, datetime.now().isoformat())
+            ).rowcount
+        if not inserted:
+            st.warning("⚠️ This email is already registered. Please login or reset your password.")
+            return False # Registered concurrently
         logger.info(f"User {user_id} registered successfully.")
         
         body = f"""Welcome to Nutrition Chatbot!
@@ -563,13 +990,10 @@ Please verify your account by entering the OTP when prompted. You will be requir
 Best regards,
 Nutrition Team
 """
-        if send_email(user_id, "Nutrition Chatbot Registration", body):
-            st.success("✅ Registration successful! Please check your email for the OTP and temporary password.")
-            return True
-        else:
-            st.error("❌ Registration successful, but failed to send verification email. Please contact support.")
-            # Optionally, revert registration or flag user for manual verification
-            return False
+        # Sent in the background so registration doesn't wait on SMTP; failures are logged by the sender
+        queue_email(user_id, "Nutrition Chatbot Registration", body)
+        st.success("✅ Registration successful! Please check your email for the OTP and temporary password.")
+        return True
             
     except Exception as e:
         logger.error(f"Error registering user: {str(e)}")
@@ -583,12 +1007,14 @@ def verify_otp(user_id, otp_input):
             st.error("❌ User database not found. Cannot verify OTP.")
             return False
             
-        df = pd.read_csv(USER_DB_FILE)
-        user = df[df.user_id == user_id]
+        conn = get_user_db()
+        with conn:
+            verified = conn.execute(
+                "UPDATE users SET verified = 1 WHERE user_id = ? AND otp = ?",
+                (user_id, str(otp_input).strip())
+            ).rowcount
         
-        if not user.empty and str(user.iloc[0]['otp']).strip() == str(otp_input).strip():
-            df.loc[df.user_id == user_id, 'verified'] = True
-            df.to_csv(USER_DB_FILE, index=False)
+        if verified:
             logger.info(f"User {user_id} OTP verified successfully.")
             return True
         logger.warning(f"Failed OTP verification for user {user_id}")
@@ -605,19 +1031,22 @@ def check_login(user_id, password):
         if not os.path.exists(USER_DB_FILE):
             return "not_registered"
             
-        df = pd.read_csv(USER_DB_FILE)
-        user = df[df.user_id == user_id]
+        user = get_user_db().execute(
+            "SELECT password, verified, needs_password_change FROM users WHERE user_id = ?",
+            (user_id,)
+        ).fetchone()
         
-        if user.empty:
+        if user is None:
             return "not_registered"
             
-        if not user.iloc[0]['verified']:
+        stored_password, verified, needs_password_change = user
+        if not verified:
             return "not_verified"
             
         try:
-            if bcrypt.checkpw(password.encode(), user.iloc[0]['password'].encode()):
+            if bcrypt.checkpw(password.encode(), stored_password.encode()):
                 # Check if password change is required (first login or reset)
-                if user.iloc[0]['needs_password_change']:
+                if needs_password_change:
                     return "change_required"
                 else:
                     return "success"
@@ -633,6 +1062,25 @@ def check_login(user_id, password):
         st.error(f"❌ An unexpected error occurred during login: {str(e)}")
         return "error"
 
+def start_password_reset(user_id):
+    """Issue a new OTP and require re-verification plus a password change; returns the OTP, or None for unknown users"""
+    try:
+        new_otp = generate_otp()
+        conn = get_user_db()
+        with conn:
+            updated = conn.execute(
+                "UPDATE users SET otp = ?, verified = 0, needs_password_change = 1 WHERE user_id = ?",
+                (new_otp, user_id)
+            ).rowcount
+        if updated:
+            logger.info(f"Password reset started for user {user_id}.")
+            return new_otp
+        return None
+    except Exception as e:
+        logger.error(f"Error starting password reset: {str(e)}")
+        st.error(f"❌ Error starting password reset: {str(e)}")
+        return None
+
 def update_password(user_id, new_password):
     """Update user password"""
     try:
@@ -640,16 +1088,23 @@ def update_password(user_id, new_password):
             st.error("❌ User database not found. Cannot update password.")
             return False
 
-        df = pd.read_csv(USER_DB_FILE)
+        # Reject before paying for a bcrypt round; callers check the full policy first
+        if not new_password or not meets_password_policy(new_password):
+            st.error("❌ New password does not meet the password requirements.")
+            return False
+
         hashed = hash_password(new_password)
         
         if not hashed:
             st.error("❌ Failed to hash new password.")
             return False
             
-        df.loc[df.user_id == user_id, 'password'] = hashed
-        df.loc[df.user_id == user_id, 'needs_password_change'] = False
-        df.to_csv(USER_DB_FILE, index=False)
+        conn = get_user_db()
+        with conn:
+            conn.execute(
+                "UPDATE users SET password = ?, needs_password_change = 0 WHERE user_id = ?",
+                (hashed, user_id)
+            )
         logger.info(f"Password updated successfully for user {user_id}.")
         return True
         
@@ -658,15 +1113,23 @@ def update_password(user_id, new_password):
         st.error(f"❌ Error updating password: {str(e)}")
         return False
 
+@st.cache_data(ttl=300, show_spinner=False)
+def _read_user_profile(user_id, mtime):
+    """Cached profile read; the file's mtime is part of the key so an edited profile is never served stale"""
+    # Only this user's partition is read; other profiles are never parsed
+    # Plain dict: a single row doesn't need pandas, and dict lookups are cheap on every rerun
+    user_profile = pq.read_table(_profile_path(user_id)).to_pylist()[0]
+    user_profile['user_id'] = user_id
+    return user_profile
+
 def load_user_profile(user_id):
     """Load user profile with error handling"""
     try:
-        if os.path.exists(USER_PROFILE_FILE):
-            profile_df = pd.read_csv(USER_PROFILE_FILE)
-            user_profile = profile_df[profile_df['user_id'] == user_id]
-            if not user_profile.empty:
-                logger.info(f"Profile loaded for user {user_id}.")
-                return user_profile.iloc[0]
+        profile_path = _profile_path(user_id)
+        if os.path.exists(profile_path):
+            user_profile = _read_user_profile(user_id, os.path.getmtime(profile_path))
+            logger.info(f"Profile loaded for user {user_id}.")
+            return user_profile
         logger.info(f"No profile found for user {user_id}.")
         return None
     except Exception as e:
@@ -674,51 +1137,47 @@ def load_user_profile(user_id):
         st.error(f"❌ Error loading your profile: {str(e)}")
         return None
 
+def current_user_profile():
+    """The logged-in user's profile, kept on st.session_state after the first load"""
+    if st.session_state.user_profile is None:
+        st.session_state.user_profile = load_user_profile(st.session_state.user_id)
+    return st.session_state.user_profile
+
 def save_user_profile(user_id, age, height, weight, gender, medical_conditions, diet_goal, vegetarian, activity_level):
-    """Save user profile to CSV, including BMI and daily calories."""
+    """Save user profile to its Parquet partition, including BMI and daily calories."""
     try:
-        if not os.path.exists(USER_PROFILE_FILE):
-            ensure_user_db() # Ensure the file exists
-            
-        profile_df = pd.read_csv(USER_PROFILE_FILE)
-
         bmi = calculate_bmi(weight, height)
         daily_calories = calculate_daily_calories(age, gender, weight, height, activity_level, diet_goal)
         
         # Convert list of medical conditions to a comma-separated string
-        medical_conditions_str = ", ".join(medical_conditions) if medical_conditions else ""
-
-        # Check if user profile already exists to update or create new
-        if user_id in profile_df['user_id'].values:
-            profile_df.loc[profile_df['user_id'] == user_id, [
-                'age', 'height', 'weight', 'gender', 'medical_conditions', 'diet_goal',
-                'vegetarian', 'bmi', 'daily_calories', 'activity_level', 'created_at'
-            ]] = [
-                age, height, weight, gender, medical_conditions_str, diet_goal,
-                vegetarian, bmi, daily_calories, activity_level, datetime.now().isoformat()
-            ]
+        medical_conditions_str = ", ".join(map(str, medical_conditions))
+
+        # Check if user profile already exists to report update vs. create
+        profile_exists = os.path.exists(_profile_path(user_id))
+
+        # Replaces only this user's partition; no read-modify-write of other profiles
+        _write_profile(user_id, {
+            'age': age,
+            'height': height,
+            'weight': weight,
+            'gender': gender,
+            'medical_conditions': medical_conditions_str,
+            'diet_goal': diet_goal,
+            'vegetarian': vegetarian,
+            'bmi': bmi,
+            'daily_calories': daily_calories,
+            'activity_level': activity_level,
+            'created_at': datetime.now().isoformat()
+        })
+
+        _read_user_profile.clear()
+
+        if profile_exists:
             st.success("✅ Profile updated successfully!")
             logger.info(f"Profile updated for user {user_id}.")
         else:
-            new_profile = pd.DataFrame([{
-                'user_id': user_id,
-                'age': age,
-                'height': height,
-                'weight': weight,
-                'gender': gender,
-                'medical_conditions': medical_conditions_str,
-                'diet_goal': diet_goal,
-                'vegetarian': vegetarian,
-                'bmi': bmi,
-                'daily_calories': daily_calories,
-                'activity_level': activity_level,
-                'created_at': datetime.now().isoformat()
-            }])
-            profile_df = pd.concat([profile_df, new_profile], ignore_index=True)
             st.success("✅ Profile saved successfully!")
             logger.info(f"New profile created for user {user_id}.")
-            
-        profile_df.to_csv(USER_PROFILE_FILE, index=False)
         return True
     except Exception as e:
         logger.error(f"Error saving user profile for {user_id}: {str(e)}")
@@ -747,27 +1206,9 @@ def calculate_daily_calories(age, gender, weight, height, activity_level, diet_g
         else: # Assuming female for any other input or default
             bmr = (10 * weight) + (6.25 * height) - (5 * age) - 161
         
-        # Activity multipliers
-        activity_multipliers = {
-            "sedentary": 1.2, # little or no exercise
-            "light": 1.375, # light exercise/sports 1-3 days/week
-            "moderate": 1.55, # moderate exercise/sports 3-5 days/week
-            "active": 1.725, # hard exercise/sports 6-7 days a week
-            "very active": 1.9 # very hard exercise/physical job
-        }
-        
-        # Goal adjustments
-        goal_adjustments = {
-            "weight loss": -500,
-            "weight gain": 500,
-            "muscle gain": 300, # A slight caloric surplus for muscle gain
-            "maintain weight": 0
-        }
-        
         # Calculate TDEE (Total Daily Energy Expenditure)
-        tdee = bmr * activity_multipliers.get(activity_level.lower(), 1.55) # Default to moderate if invalid
-        goal = diet_goal.lower()
-        adjustment = goal_adjustments.get(goal, 0)
+        tdee = bmr * ACTIVITY_MULTIPLIERS.get(activity_level.lower(), 1.55) # Default to moderate if invalid
+        adjustment = GOAL_ADJUSTMENTS.get(diet_goal.lower(), 0)
         
         # Ensure minimum calories and return rounded value
         calculated_calories = round(tdee + adjustment)
@@ -779,18 +1220,22 @@ def calculate_daily_calories(age, gender, weight, height, activity_level, diet_g
         return 2000  # Default fallback
 
 # --- Enhanced Meal Planning ---
-def generate_comprehensive_meal_plan():
+def parse_medical_conditions(conditions_str):
+    """Split the stored comma-separated medical conditions into a list, ignoring blanks and missing values"""
+    if not isinstance(conditions_str, str):
+        return []
+    return [condition for condition in _SPLIT_COMMA.split(conditions_str.strip()) if condition]
+
+def generate_comprehensive_meal_plan(force_refresh=False):
     """Generate meal plan using Google API with user profile"""
     try:
-        profile = load_user_profile(st.session_state.user_id)
+        profile = current_user_profile()
         if profile is None:
             st.error("❌ Please complete your profile first before generating a meal plan.")
             return None
 
-        # Parse medical conditions from the profile (stored as a comma-separated string)
-        medical_conditions = []
-        if pd.notna(profile['medical_conditions']) and profile['medical_conditions']:
-            medical_conditions = [condition.strip() for condition in str(profile['medical_conditions']).split(',') if condition.strip()]
+        # Medical conditions are parsed once at login / profile save
+        medical_conditions = list(st.session_state.medical_conditions)
             
         st.info("🔄 Generating your personalized meal plan based on your profile and medical conditions...")
         
@@ -800,7 +1245,8 @@ def generate_comprehensive_meal_plan():
                 medical_conditions=medical_conditions,
                 vegetarian=profile['vegetarian'],
                 daily_calories=int(profile['daily_calories']), # Ensure integer
-                diet_goal=profile['diet_goal']
+                diet_goal=profile['diet_goal'],
+                force_refresh=force_refresh
             )
         
         if meal_plan:
@@ -828,37 +1274,23 @@ def generate_comprehensive_meal_plan():
         st.error(f"❌ An unexpected error occurred while trying to generate your meal plan: {str(e)}")
         return None
 
+def dumps_json(obj):
+    """Serialize to a JSON string in a single pass; NumPy scalars become plain JSON values, anything else unknown a string"""
+    if json_fast.__name__ == "orjson":
+        return json_fast.dumps(obj, option=json_fast.OPT_SERIALIZE_NUMPY, default=str).decode()
+    return json.dumps(obj, default=lambda o: o.item() if isinstance(o, np.generic) else str(o))
+
 def save_meal_feedback(meal_plan_dict, rating, feedback):
     """Save meal feedback for future personalization"""
     try:
-        if not os.path.exists(MEAL_HISTORY_FILE):
-            ensure_user_db()  # Ensure the file exists
-
-        history_df = pd.read_csv(MEAL_HISTORY_FILE)
-
-        # Recursively convert boolean and other non-serializable values to strings
-        def convert_bools(obj):
-            if isinstance(obj, dict):
-                return {k: convert_bools(v) for k, v in obj.items()}
-            elif isinstance(obj, list):
-                return [convert_bools(item) for item in obj]
-            elif isinstance(obj, (bool, np.bool_)):
-                return str(obj)
-            return obj
-
-        meal_plan_serializable = convert_bools(meal_plan_dict.copy())
-
-        new_feedback = pd.DataFrame([{
-            "user_id": st.session_state.user_id,
+        # Appends a new fragment to the user's partition; existing history is never read or rewritten
+        _append_meal_history(st.session_state.user_id, [{
             "date": datetime.now().isoformat(),
-            "meal": json.dumps(meal_plan_serializable, default=str),  # Handle any leftover unserializable types
+            "meal": dumps_json(meal_plan_dict),
             "rating": rating,
             "feedback": feedback
         }])
 
-        history_df = pd.concat([history_df, new_feedback], ignore_index=True)
-        history_df.to_csv(MEAL_HISTORY_FILE, index=False)
-
         st.success("📝 Thank you for your feedback! It helps us improve your future meal plans.")
         logger.info(f"Feedback saved for user {st.session_state.user_id} with rating {rating}.")
         return True
@@ -918,12 +1350,15 @@ def show_auth_interface():
                         st.session_state.user_id = login_email
                         st.session_state.login_attempts = 0 # Reset attempts on successful login
                         user_profile = load_user_profile(login_email)
+                        st.session_state.user_profile = user_profile
                         if user_profile is not None:
                             st.session_state.profile_completed = True
                             st.session_state.vegetarian = user_profile['vegetarian']
+                            st.session_state.medical_conditions = parse_medical_conditions(user_profile['medical_conditions'])
                             st.session_state.daily_calories = user_profile['daily_calories']
                             st.session_state.activity_level = user_profile['activity_level']
                             st.session_state.diet_goal = user_profile['diet_goal']
+                            st.session_state._dash_metrics = dashboard_metrics(user_profile)
                         else:
                             st.session_state.profile_completed = False
                         st.success("✅ Logged in successfully!")
@@ -936,14 +1371,8 @@ def show_auth_interface():
                     # In a real app, you'd send a password reset link/OTP to the email
                     st.info("ℹ️ If this email is registered, a password reset link/OTP has been sent. (Functionality not fully implemented here)")
                     # For this example, we can trigger OTP verification if user exists
-                    df = pd.read_csv(USER_DB_FILE)
-                    if login_email in df['user_id'].values:
-                        user_record = df[df['user_id'] == login_email].iloc[0]
-                        new_otp = generate_otp()
-                        df.loc[df['user_id'] == login_email, 'otp'] = new_otp
-                        df.loc[df['user_id'] == login_email, 'verified'] = False # Re-verify for password reset
-                        df.loc[df['user_id'] == login_email, 'needs_password_change'] = True # Force password change
-                        df.to_csv(USER_DB_FILE, index=False)
+                    new_otp = start_password_reset(login_email)
+                    if new_otp:
                         if send_email(login_email, "Nutrition Chatbot Password Reset OTP", f"Your OTP for password reset is: {new_otp}"):
                             st.session_state.user_id = login_email
                             st.session_state.show_otp_verification = True
@@ -998,10 +1427,7 @@ def show_auth_interface():
                     if new_password == DEFAULT_PASSWORD:
                         st.error("❌ New password cannot be the same as the temporary password.")
                     elif new_password == confirm_password:
-                        if len(new_password) < 8 or not any(char.isdigit() for char in new_password) or \
-                           not any(char.isupper() for char in new_password) or \
-                           not any(char.islower() for char in new_password) or \
-                           not any(char in "!@#$%^&*()-_+=" for char in new_password):
+                        if not meets_password_policy(new_password):
                             st.error("❌ Password must be at least 8 characters long and contain at least one uppercase letter, one lowercase letter, one digit, and one special character (!@#$%^&*()-_+=).")
                         else:
                             if update_password(st.session_state.user_id, new_password):
@@ -1031,44 +1457,36 @@ def show_profile_completion_interface():
     initial_gender = user_profile['gender'] if user_profile is not None and pd.notna(user_profile['gender']) else "Male"
     
     # Handle medical conditions (stored as comma-separated string)
-    initial_medical_conditions_str = user_profile['medical_conditions'] if user_profile is not None and pd.notna(user_profile['medical_conditions']) else ""
-    initial_medical_conditions = [cond.strip() for cond in initial_medical_conditions_str.split(',') if cond.strip()]
+    initial_medical_conditions = parse_medical_conditions(user_profile['medical_conditions']) if user_profile is not None else []
 
     initial_diet_goal = user_profile['diet_goal'] if user_profile is not None and pd.notna(user_profile['diet_goal']) else "Maintain Weight"
     initial_vegetarian = user_profile['vegetarian'] if user_profile is not None and pd.notna(user_profile['vegetarian']) else False
-    
-    # Fix for activity level - ensure case matches the options
-    activity_options = ["Sedentary", "Light", "Moderate", "Active", "Very Active"]
     initial_activity_level = user_profile['activity_level'] if user_profile is not None and pd.notna(user_profile['activity_level']) else "Moderate"
-    # Convert to proper case if needed
-    if initial_activity_level.lower() == "moderate":
-        initial_activity_level = "Moderate"
 
     with st.form("profile_form", clear_on_submit=False):
         age = st.slider("Age (Years)", 18, 99, int(initial_age))
         height = st.slider("Height (cm)", 100, 250, int(initial_height))
         weight = st.slider("Weight (kg)", 30, 200, int(initial_weight))
-        gender = st.radio("Gender", ["Male", "Female", "Other"], index=["Male", "Female", "Other"].index(initial_gender))
+        gender = st.radio("Gender", GENDER_OPTIONS, index=GENDER_INDEX[initial_gender])
         
         # Multiselect for medical conditions
-        all_medical_conditions = list(MEDICAL_CONDITIONS.keys())
         medical_conditions = st.multiselect(
             "Select any applicable medical conditions:",
-            options=all_medical_conditions,
+            options=MEDICAL_CONDITION_OPTIONS,
             default=initial_medical_conditions,
             help="This will help us tailor your meal plan to your health needs."
         )
 
         diet_goal = st.selectbox(
             "Your Diet Goal",
-            ["Maintain Weight", "Weight Loss", "Weight Gain", "Muscle Gain"],
-            index=["Maintain Weight", "Weight Loss", "Weight Gain", "Muscle Gain"].index(initial_diet_goal)
+            DIET_GOAL_OPTIONS,
+            index=DIET_GOAL_INDEX[initial_diet_goal]
         )
         vegetarian = st.checkbox("Are you Vegetarian?", value=initial_vegetarian)
         activity_level = st.selectbox(
             "Activity Level",
-            activity_options,
-            index=activity_options.index(initial_activity_level)
+            ACTIVITY_OPTIONS,
+            index=ACTIVITY_INDEX.get(initial_activity_level.lower(), ACTIVITY_INDEX["moderate"])
         )
 
         # Proper submit button using st.form_submit_button()
@@ -1080,9 +1498,12 @@ def show_profile_completion_interface():
                     st.session_state.profile_completed = True
                     # Update session state with new profile values
                     st.session_state.vegetarian = vegetarian
+                    st.session_state.medical_conditions = list(medical_conditions)
                     st.session_state.daily_calories = calculate_daily_calories(age, gender, weight, height, activity_level, diet_goal)
                     st.session_state.activity_level = activity_level
                     st.session_state.diet_goal = diet_goal
+                    st.session_state.user_profile = None # Reloaded from the saved partition on next use
+                    st.session_state.pop('_dash_metrics', None) # Rebuilt from the saved profile on the dashboard
                     st.rerun() # Rerun to transition to main app
             else:
                 st.error("❌ Please fill in all required profile fields.")
@@ -1093,6 +1514,8 @@ def display_meal_plan(meal_plan):
         st.warning("No meal plan available to display.")
         return
 
+    from streamlit_extras.colored_header import colored_header # Only needed once a plan exists
+
     st.subheader(f"🍽️ Your Personalized Meal Plan")
     st.write(f"Generated for: **{st.session_state.user_id}** on **{datetime.now().strftime('%Y-%m-%d')}**")
 
@@ -1106,11 +1529,14 @@ def display_meal_plan(meal_plan):
     st.info(f"**Medical Compliance:** {daily_summary.get('medical_compliance', 'N/A')}")
     st.markdown("---")
 
+    daily_calories = st.session_state.daily_calories
+    meal_targets = {meal_type: round(daily_calories * ratio) for meal_type, ratio in MEAL_RATIOS.items()}
+
     meal_order = ["breakfast", "lunch", "dinner", "snacks"]
     for meal_type in meal_order:
         meal_data = meal_plan.get(meal_type)
         if meal_data:
-            st.markdown(f"#### 🥣 {meal_type.capitalize()} (Target: {round(st.session_state.daily_calories * (0.25 if meal_type == 'breakfast' else (0.35 if meal_type == 'lunch' else (0.30 if meal_type == 'dinner' else 0.10))))} kcal)")
+            st.markdown(f"#### 🥣 {meal_type.capitalize()} (Target: {meal_targets[meal_type]} kcal)")
             st.markdown(f"**Total Calories:** {round(meal_data.get('total_calories', 0))} kcal")
             st.markdown(f"**Benefits:** {meal_data.get('meal_benefits', 'N/A')}")
             
@@ -1124,15 +1550,8 @@ def display_meal_plan(meal_plan):
                     st.write(f"**Benefits:** {item.get('benefits', 'N/A')}")
 
                     # Option to find alternatives
-                    # Get user's current medical conditions and vegetarian preference
-                    user_profile_data = load_user_profile(st.session_state.user_id)
-                    current_medical_conditions = []
-                    if user_profile_data is not None and pd.notna(user_profile_data['medical_conditions']):
-                        current_medical_conditions = [cond.strip() for cond in str(user_profile_data['medical_conditions']).split(',') if cond.strip()]
-                    current_vegetarian = user_profile_data['vegetarian'] if user_profile_data is not None else False
-
                     if st.button(f"Find alternatives for {item.get('food', 'this item')}", key=f"alt_{meal_type}_{item.get('food')}"):
-                        alternatives = get_food_alternatives(item['food'], current_medical_conditions, current_vegetarian)
+                        alternatives = get_food_alternatives(item['food'], st.session_state.medical_conditions, st.session_state.vegetarian)
                         if alternatives:
                             st.success(f"Here are some alternatives for {item['food']}:")
                             for alt in alternatives:
@@ -1155,6 +1574,15 @@ def display_meal_plan(meal_plan):
             else:
                 st.error("❌ Failed to save feedback. Please try again.")
 
+def dashboard_metrics(user_profile):
+    """(label, value, caption) for each dashboard metric, computed once per profile"""
+    bmi = user_profile['bmi']
+    return (
+        ("BMI", f"{bmi}", get_bmi_category(bmi)),
+        ("Target Calories", f"{int(user_profile['daily_calories'])} kcal", None),
+        ("Diet Goal", user_profile['diet_goal'], None),
+    )
+
 def show_main_app_interface():
     """Main application interface after login and profile completion."""
     st.sidebar.title(f"Welcome, {st.session_state.user_id.split('@')[0]}!")
@@ -1165,8 +1593,11 @@ def show_main_app_interface():
         st.rerun()
 
     if st.sidebar.button("🔄 Generate New Meal Plan"):
-        st.session_state.current_meal_plan = generate_comprehensive_meal_plan()
-        st.rerun()
+        # The dashboard is rendered below in this same run, so no extra rerun is needed.
+        # The first plan after login / profile save may come from the cache; asking again while a plan is shown always gets a new one
+        st.session_state.current_meal_plan = generate_comprehensive_meal_plan(
+            force_refresh=st.session_state.current_meal_plan is not None
+        )
         
     if st.sidebar.button("🚪 Logout"):
         st.session_state.logged_in = False
@@ -1177,54 +1608,98 @@ def show_main_app_interface():
         st.session_state.show_password_change = False
         st.session_state.show_otp_verification = False
         st.session_state.current_meal_plan = None
+        st.session_state.medical_conditions = []
+        st.session_state.user_profile = None
+        st.session_state.pop('_dash_metrics', None)
         st.session_state.generated_meal_count = 0
         st.success("👋 You have been logged out.")
         st.rerun()
 
-    # Main content area
+    _render_dashboard()
+
+
+@st.fragment
+def _render_dashboard():
+    """Dashboard body; widgets inside it (e.g. the alternatives buttons) rerun only this fragment."""
     st.header("📊 Your Daily Nutrition Dashboard")
 
-    user_profile = load_user_profile(st.session_state.user_id)
-    if user_profile is not None:
-        bmi = user_profile['bmi']
-        daily_calories = user_profile['daily_calories']
-        
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric("BMI", f"{bmi}")
-            st.caption(get_bmi_category(bmi))
-        with col2:
-            st.metric("Target Calories", f"{int(daily_calories)} kcal")
-        with col3:
-            st.metric("Diet Goal", user_profile['diet_goal'])
-
-        st.markdown("---")
-        st.markdown("### 📋 Current Meal Plan")
-
-        if st.session_state.current_meal_plan:
-            display_meal_plan(st.session_state.current_meal_plan)
-        else:
-            st.info("No meal plan generated yet for today. Click 'Generate New Meal Plan' in the sidebar to get started!")
+    if '_dash_metrics' not in st.session_state:
+        user_profile = current_user_profile()
+        if user_profile is None:
+            st.error("❌ User profile not found. Please complete your profile.")
+            st.session_state.profile_completed = False # Force profile completion
+            st.rerun()
+        st.session_state._dash_metrics = dashboard_metrics(user_profile)
+
+    for col, (label, value, caption) in zip(st.columns(3), st.session_state._dash_metrics):
+        col.metric(label, value)
+        if caption:
+            col.caption(caption)
+
+    st.markdown("---")
+    st.markdown("### 📋 Current Meal Plan")
 
+    if st.session_state.current_meal_plan:
+        display_meal_plan(st.session_state.current_meal_plan)
     else:
-        st.error("❌ User profile not found. Please complete your profile.")
-        st.session_state.profile_completed = False # Force profile completion
-        st.rerun()
+        st.info("No meal plan generated yet for today. Click 'Generate New Meal Plan' in the sidebar to get started!")
 
 
 def get_bmi_category(bmi):
-    if bmi < 18.5:
-        return "Underweight"
-    elif 18.5 <= bmi < 24.9:
-        return "Normal weight"
-    elif 25 <= bmi < 29.9:
-        return "Overweight"
-    else:
-        return "Obese"
+    return _BMI_LABELS[bisect.bisect_right(_BMI_CUTS, bmi)]
 
 # --- Main Application Flow ---
+CSS_BLOCK = """
+<style>
+.stButton>button {
+    border-radius: 20px;
+    border: 1px solid #4CAF50;
+    color: #FFFFFF;
+    background-color: #4CAF50;
+    font-size: 16px;
+    padding: 10px 24px;
+    cursor: pointer;
+}
+.stButton>button:hover {
+    background-color: #45a049;
+    border: 1px solid #45a049;
+}
+.stTextInput>div>div>input {
+    border-radius: 20px;
+    padding: 10px 15px;
+}
+.stTextArea>div>div>textarea {
+    border-radius: 20px;
+    padding: 10px 15px;
+}
+.stSlider .stSliderHandle {
+    background-color: #4CAF50;
+}
+.stSlider .stSliderTrack {
+    background-color: #E6E6E6;
+}
+.stSlider [data-baseweb="slider"] {
+    background-color: #4CAF50;
+}
+.stAlert {
+    border-radius: 10px;
+}
+.css-1d391kg e16zcsfj9 { /* This targets the main content area */
+    padding-top: 1rem;
+}
+</style>
+"""
+
+def _inject_css():
+    """Emit the app stylesheet; it must be re-sent on every rerun or Streamlit drops the element"""
+    st.markdown(CSS_BLOCK, unsafe_allow_html=True)
+
+# Indexed by logged_in + profile_completed: auth, profile completion, main app
+_ROUTES = (show_auth_interface, show_profile_completion_interface, show_main_app_interface)
+
 def main():
     """Main function to run the Streamlit application"""
+    # Sent on every run: the frontend resets the tab title and icon on each full rerun
     st.set_page_config(
         page_title="Nutrition Assistant",
         page_icon="🥗",
@@ -1232,64 +1707,21 @@ def main():
         initial_sidebar_state="expanded"
     )
 
+    # Setup checks only run on a session's first script run
+    if not st.session_state.get('_booted'):
+        # Ensure databases exist and configure Google API (once per process)
+        if not _bootstrap():
+            _bootstrap.clear() # Don't cache the failure; retry on the next run
+            st.stop() # Stop execution if database setup fails or API key is missing
+        st.session_state._booted = True
+
     initialize_session_state()
 
-    # Ensure databases exist before anything else
-    if not ensure_user_db() or not ensure_nutrition_db() or not ensure_food_db():
-        st.stop() # Stop execution if database setup fails
-
-    # Load environment variables and configure Google API
-    if not load_environment():
-        st.stop() # Stop if API key is missing
-
-    # Apply custom CSS
-    st.markdown("""
-        <style>
-        .stButton>button {
-            border-radius: 20px;
-            border: 1px solid #4CAF50;
-            color: #FFFFFF;
-            background-color: #4CAF50;
-            font-size: 16px;
-            padding: 10px 24px;
-            cursor: pointer;
-        }
-        .stButton>button:hover {
-            background-color: #45a049;
-            border: 1px solid #45a049;
-        }
-        .stTextInput>div>div>input {
-            border-radius: 20px;
-            padding: 10px 15px;
-        }
-        .stTextArea>div>div>textarea {
-            border-radius: 20px;
-            padding: 10px 15px;
-        }
-        .stSlider .stSliderHandle {
-            background-color: #4CAF50;
-        }
-        .stSlider .stSliderTrack {
-            background-color: #E6E6E6;
-        }
-        .stSlider [data-baseweb="slider"] {
-            background-color: #4CAF50;
-        }
-        .stAlert {
-            border-radius: 10px;
-        }
-        .css-1d391kg e16zcsfj9 { /* This targets the main content area */
-            padding-top: 1rem;
-        }
-        </style>
-        """, unsafe_allow_html=True)
+    # Apply custom CSS (re-emitted every run; elements not sent on a rerun are removed)
+    _inject_css()
 
-    if not st.session_state.logged_in:
-        show_auth_interface()
-    elif not st.session_state.profile_completed:
-        show_profile_completion_interface()
-    else:
-        show_main_app_interface()
+    logged_in = bool(st.session_state.logged_in)
+    _ROUTES[logged_in + (logged_in and bool(st.session_state.profile_completed))]()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file